@@ -0,0 +1,25 @@
+import os
+import logging
+from dotenv import load_dotenv
+
+# Load environment variables once for every module
+load_dotenv()
+
+# Set up logging; skipped when the root logger was already configured
+if not logging.getLogger().handlers:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+MONGO_URI = os.getenv("MONGO_URI")
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_API_ID = os.getenv("TELEGRAM_API_ID")
+TELEGRAM_API_HASH = os.getenv("TELEGRAM_API_HASH")
+TELETHON_SESSION_STRING = os.getenv("TELETHON_SESSION_STRING")
+OWNER_NAME = os.getenv("OWNER_NAME", "MovieBot Team")
+
+# Webhook mode is used when WEBHOOK_URL is set; otherwise the bot polls
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
@@ -1,53 +1,181 @@
-import os
+import re
+import time
+import asyncio
 import logging
-from pymongo import MongoClient, TEXT, errors
+from collections import OrderedDict
+from functools import lru_cache
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, errors
 from pymongo.errors import DuplicateKeyError, PyMongoError
-from dotenv import load_dotenv
 from bson.objectid import ObjectId
+from config import MONGO_URI
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # MongoDB connection
-load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
 if not MONGO_URI:
     logger.error("MONGO_URI is not set")
     raise ValueError("MONGO_URI is not set")
 
-try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    db = client.get_database("movie_bot")
-    movies_collection = db.movies
-    users_collection = db.users
-except errors.ConnectionError as e:
-    logger.error(f"Failed to connect to MongoDB: {str(e)}")
-    raise
+# One client for the whole process. Motor defers connecting until the first
+# operation, so importing this module does not open any sockets.
+client = AsyncIOMotorClient(
+    MONGO_URI,
+    maxPoolSize=20,
+    minPoolSize=2,
+    maxIdleTimeMS=30000,
+    serverSelectionTimeoutMS=3000,
+    socketTimeoutMS=10000,
+    retryWrites=True,
+    appname="moviebot",
+)
+db = client.get_database("movie_bot")
+movies_collection = db.movies
+users_collection = db.users
+channels_collection = db.channels
+# One document per one-off data migration that has already run
+migrations_collection = db.migrations
 
-def check_db_connection():
+# Byte thresholds for file size labels, as bit shifts
+_GB_SHIFT = 30
+_MB_SHIFT = 20
+_GB = 1 << _GB_SHIFT
+
+# Fields returned by search_movies; everything else stays on the server
+SEARCH_PROJECTION = {
+    "title": 1,
+    "year": 1,
+    "quality": 1,
+    "file_size": 1,
+    "file_size_bytes": 1,
+    "file_id": 1,
+    "message_id": 1,
+    "channel_id": 1,
+    "language": 1,
+}
+
+# Words left out of titles and queries alike; a search made only of these matches nothing useful
+SEARCH_STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in",
+    "is", "it", "of", "on", "or", "the", "to", "with",
+})
+
+# Longest run of title words stored in phraselist
+PHRASE_MAX_WORDS = 3
+
+# Title matches fetched per page before year/language are applied in Python
+TITLE_CANDIDATE_LIMIT = 200
+
+_WORD_RE = re.compile(r"\w+")
+
+# chat_id -> (cached_at, settings tuple), least recently used first;
+# kept current by update_user_settings
+SETTINGS_CACHE_TTL = 300
+SETTINGS_CACHE_SIZE = 4096
+SETTINGS_PROJECTION = {"_id": 0, "thumbnail_file_id": 1, "prefix": 1, "caption": 1}
+_settings_cache = OrderedDict()
+
+# (cached_at, (users, movies)) for /stats; collection counts barely move between calls
+STATS_CACHE_TTL = 60
+_stats_cache = (0.0, None)
+# One refresh at a time; concurrent /stats calls wait for it and reuse the result
+_stats_lock = asyncio.Lock()
+
+def title_words(text):
+    """Split text into the lowercase words used for title matching."""
+    return [
+        word for word in _WORD_RE.findall(text.lower())
+        if word not in SEARCH_STOPWORDS and (len(word) > 1 or word.isdigit())
+    ]
+
+@lru_cache(maxsize=1024)
+def _query_words(title):
+    """Cached title_words for search input, which paging repeats verbatim."""
+    return tuple(title_words(title))
+
+def title_phrases(title):
+    """Return every run of 1..PHRASE_MAX_WORDS consecutive title words."""
+    words = title_words(title)
+    return sorted({
+        " ".join(words[i:i + n])
+        for n in range(1, PHRASE_MAX_WORDS + 1)
+        for i in range(len(words) - n + 1)
+    })
+
+async def check_db_connection():
     """Check if MongoDB connection is healthy."""
     try:
-        client.server_info()
+        await client.server_info()
         return True
-    except errors.ConnectionError as e:
-        logger.error(f"MongoDB connection error: {str(e)}")
+    except errors.ConnectionFailure as e:
+        logger.error("MongoDB connection error: %s", e)
         return False
 
-def init_db():
+async def _drop_legacy_index(collection, name):
+    """Drop an index left over from an older schema, if it still exists."""
+    if name in await collection.index_information():
+        await collection.drop_index(name)
+        logger.info("Dropped legacy index %s on %s", name, collection.name)
+
+async def _backfill_phraselists(batch_size=500):
+    """Store title phrases on movies indexed before phraselist existed."""
+    operations = []
+    updated = 0
+    cursor = (
+        movies_collection.find({"phraselist": {"$exists": False}}, projection={"title": 1})
+        .batch_size(batch_size)
+    )
+    async for movie in cursor:
+        operations.append(UpdateOne(
+            {"_id": movie["_id"]},
+            {"$set": {"phraselist": title_phrases(movie["title"])}}
+        ))
+        if len(operations) >= batch_size:
+            await movies_collection.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        await movies_collection.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    if updated:
+        logger.info("Backfilled phraselist for %s movies", updated)
+
+async def _run_migration_once(name, migration):
+    """Run a one-off data migration unless it is already recorded as done."""
+    if await migrations_collection.find_one({"_id": name}):
+        return
+    await migration()
+    await migrations_collection.update_one(
+        {"_id": name}, {"$currentDate": {"completed_at": True}}, upsert=True
+    )
+    logger.info("Completed migration %s", name)
+
+async def init_db():
     """Initialize database with necessary indexes."""
     try:
-        movies_collection.create_index([("file_id", 1)], unique=True)
-        movies_collection.create_index([("message_id", 1), ("channel_id", 1)], unique=True)
-        movies_collection.create_index([("title", TEXT), ("year", 1), ("language", 1)])
-        movies_collection.create_index([("channel_id", 1)])
-        users_collection.create_index([("chat_id", 1)], unique=True)
+        # Title search runs on phraselist_id_1 and the year/language filters on
+        # lang_year_id_1 (equality fields, most selective first), so the old text
+        # index is only write overhead.
+        # Both end in _id so they also return matches in the keyset paging order
+        await _drop_legacy_index(movies_collection, "title_text_year_1_language_1")
+        # Movies indexed before phraselist existed are backfilled on the first start only
+        await _run_migration_once("phraselist_backfill", _backfill_phraselists)
+        # channel_message_1 replaces both: it is the dedup key for indexing, since a
+        # Bot API file_id can change between forwards, and serves channel_id alone by prefix
+        await _drop_legacy_index(movies_collection, "message_id_1_channel_id_1")
+        await _drop_legacy_index(movies_collection, "channel_id_1")
+        await movies_collection.create_index([("file_id", 1)], unique=True)
+        await movies_collection.create_index([("channel_id", 1), ("message_id", 1)], name="channel_message_1", unique=True)
+        await movies_collection.create_index([("phraselist", 1), ("_id", 1)], name="phraselist_id_1")
+        await movies_collection.create_index([("language", 1), ("year", 1), ("_id", 1)], name="lang_year_id_1")
+        await users_collection.create_index([("chat_id", 1)], unique=True)
+        await channels_collection.create_index([("channel_id", 1)], unique=True)
         logger.info("Database indexes created successfully")
     except errors.PyMongoError as e:
-        logger.error(f"Error creating indexes: {str(e)}")
+        logger.error("Error creating indexes: %s", e)
         raise
 
-def add_user(chat_id):
+async def add_user(chat_id):
     """Add a new user to the database with default settings."""
     try:
         user_doc = {
@@ -56,153 +184,335 @@ def add_user(chat_id):
             "prefix": None,
             "caption": None
         }
-        users_collection.update_one(
+        await users_collection.update_one(
             {"chat_id": chat_id},
             {"$setOnInsert": user_doc},
             upsert=True
         )
-        logger.info(f"Added/updated user {chat_id}")
+        logger.info("Added/updated user %s", chat_id)
     except DuplicateKeyError:
-        logger.info(f"User {chat_id} already exists")
+        logger.info("User %s already exists", chat_id)
     except PyMongoError as e:
-        logger.error(f"Error adding user {chat_id}: {str(e)}")
+        logger.error("Error adding user %s: %s", chat_id, e)
         raise
 
-def update_user_settings(chat_id, thumbnail_file_id=None, prefix=None, caption=None):
-    """Update user settings in the database."""
-    try:
-        update_fields = {}
-        if thumbnail_file_id is not None:
-            update_fields["thumbnail_file_id"] = thumbnail_file_id
-        if prefix is not None:
-            update_fields["prefix"] = prefix
-        if caption is not None:
-            update_fields["caption"] = caption
-
-        if update_fields:
-            result = users_collection.update_one(
-                {"chat_id": chat_id},
-                {"$set": update_fields},
-                upsert=True
-            )
-            logger.info(f"Updated settings for user {chat_id}: {update_fields}")
-            return result.modified_count > 0
+def _write_through_settings(chat_id, update_fields):
+    """Apply a settings update to the cached tuple, or drop it if it has expired."""
+    cached = _settings_cache.get(chat_id)
+    if not cached:
+        return
+    if time.monotonic() - cached[0] >= SETTINGS_CACHE_TTL:
+        _settings_cache.pop(chat_id, None)
+        return
+
+    thumbnail_file_id, prefix, caption = cached[1]
+    _settings_cache[chat_id] = (time.monotonic(), (
+        update_fields.get("thumbnail_file_id", thumbnail_file_id),
+        update_fields.get("prefix", prefix),
+        update_fields.get("caption", caption)
+    ))
+    _settings_cache.move_to_end(chat_id)
+
+async def update_user_settings(chat_id, **fields):
+    """Update the given user settings in one upsert; a None value clears a setting."""
+    unknown = fields.keys() - {"thumbnail_file_id", "prefix", "caption"}
+    if unknown:
+        raise TypeError(f"Unknown user settings: {', '.join(sorted(unknown))}")
+    if not fields:
         return False
+
+    try:
+        result = await users_collection.update_one(
+            {"chat_id": chat_id},
+            {"$set": fields},
+            upsert=True
+        )
+        _write_through_settings(chat_id, fields)
+        logger.info("Updated settings for user %s: %s", chat_id, fields)
+        return result.modified_count > 0
     except PyMongoError as e:
-        logger.error(f"Error updating settings for user {chat_id}: {str(e)}")
+        logger.error("Error updating settings for user %s: %s", chat_id, e)
         raise
 
-def get_user_settings(chat_id):
-    """Retrieve user settings from the database."""
+async def get_user_settings(chat_id):
+    """Retrieve user settings, served from a short-lived cache when possible."""
+    cached = _settings_cache.get(chat_id)
+    if cached and time.monotonic() - cached[0] < SETTINGS_CACHE_TTL:
+        _settings_cache.move_to_end(chat_id)
+        return cached[1]
+
     try:
-        user = users_collection.find_one({"chat_id": chat_id})
+        user = await users_collection.find_one({"chat_id": chat_id}, SETTINGS_PROJECTION)
         if user:
-            return (
+            settings = (
                 user.get("thumbnail_file_id"),
                 user.get("prefix"),
                 user.get("caption")
             )
-        return None, None, None
+        else:
+            settings = (None, None, None)
+        _settings_cache[chat_id] = (time.monotonic(), settings)
+        _settings_cache.move_to_end(chat_id)
+        if len(_settings_cache) > SETTINGS_CACHE_SIZE:
+            _settings_cache.popitem(last=False)
+        return settings
     except PyMongoError as e:
-        logger.error(f"Error retrieving settings for user {chat_id}: {str(e)}")
+        logger.error("Error retrieving settings for user %s: %s", chat_id, e)
         raise
 
-def add_movie(title, year, quality, file_size, file_id, message_id, language=None, channel_id=None, retries=3):
-    """Add a single movie to the database with retry logic."""
+def format_file_size(size_bytes):
+    """Format a byte count as a GB/MB label for display."""
+    shift, unit = (_GB_SHIFT, "GB") if size_bytes >= _GB else (_MB_SHIFT, "MB")
+    # Hundredths of the unit in integer arithmetic; exact ties round to even,
+    # as the :.2f labels of earlier versions did
+    hundredths, remainder = divmod(size_bytes * 100, 1 << shift)
+    half = 1 << (shift - 1)
+    if remainder > half or (remainder == half and hundredths & 1):
+        hundredths += 1
+    return f"{hundredths // 100}.{hundredths % 100:02d}{unit}"
+
+def movie_file_size(movie):
+    """Return the display size of a movie document, old or new schema."""
+    if movie.get("file_size_bytes") is not None:
+        return format_file_size(movie["file_size_bytes"])
+    # Documents indexed before sizes were stored in bytes carry the label itself
+    return movie.get("file_size")
+
+def build_movie_doc(title, year, quality, file_size_bytes, file_id, message_id, language=None, channel_id=None):
+    """Build a movie document with normalized fields, ready for insertion."""
     movie_doc = {
         "title": title,
         "year": year,
         "quality": quality,
-        "file_size": file_size,
+        "file_size_bytes": file_size_bytes,
         "file_id": file_id,
         "message_id": message_id,
-        "channel_id": channel_id
+        "channel_id": channel_id,
+        "phraselist": title_phrases(title)
     }
     if language:
-        movie_doc["language"] = language
+        movie_doc["language"] = language.lower()
+    return movie_doc
+
+async def add_movie(title, year, quality, file_size_bytes, file_id, message_id, language=None, channel_id=None, retries=3):
+    """Add a single movie to the database with retry logic."""
+    movie_doc = build_movie_doc(title, year, quality, file_size_bytes, file_id, message_id, language, channel_id)
 
     attempt = 0
     while attempt < retries:
         try:
-            result = movies_collection.insert_one(movie_doc)
-            logger.info(f"Added movie: {title} ({year}) with ID {result.inserted_id}")
+            result = await movies_collection.insert_one(movie_doc)
+            logger.info("Added movie: %s (%s) with ID %s", title, year, result.inserted_id)
             return str(result.inserted_id)
         except DuplicateKeyError:
-            logger.info(f"Movie {title} ({year}) already exists")
+            logger.info("Movie %s (%s) already exists", title, year)
             return None
         except PyMongoError as e:
             attempt += 1
             if attempt == retries:
-                logger.error(f"Failed to add movie {title} after {retries} attempts: {str(e)}")
+                logger.error("Failed to add movie %s after %s attempts: %s", title, retries, e)
                 raise
-            logger.warning(f"Retrying add_movie for {title} (attempt {attempt + 1}): {str(e)}")
+            logger.warning("Retrying add_movie for %s (attempt %s): %s", title, attempt + 1, e)
             continue
 
-def add_movies_batch(movies, retries=3):
-    """Add a batch of movies to the database with retry logic."""
+async def add_movies_batch(movies, retries=3):
+    """Add a batch of movies to the database with retry logic.
+
+    Each movie is an upsert keyed on its channel message that only writes on
+    insert, so re-indexing a channel (or retrying a batch) never duplicates or
+    rewrites documents. Returns an (inserted, duplicates) tuple.
+    """
     if not movies:
-        return []
+        return 0, 0
+
+    operations = [
+        UpdateOne(
+            {"channel_id": movie["channel_id"], "message_id": movie["message_id"]},
+            {"$setOnInsert": movie},
+            upsert=True
+        )
+        for movie in movies
+    ]
 
     attempt = 0
     while attempt < retries:
         try:
-            result = movies_collection.insert_many(movies, ordered=False)
-            inserted_ids = [str(_id) for _id in result.inserted_ids]
-            logger.info(f"Inserted {len(inserted_ids)} movies in batch")
-            return inserted_ids
+            result = await movies_collection.bulk_write(operations, ordered=False)
+            inserted = result.upserted_count
+            duplicates = result.matched_count
+            logger.info("Inserted %s movies, skipped %s duplicates in batch", inserted, duplicates)
+            return inserted, duplicates
         except errors.BulkWriteError as bwe:
-            inserted_ids = [str(doc["_id"]) for doc in bwe.details.get("writeErrors", []) if "inserted" in doc]
-            logger.info(f"Inserted {len(inserted_ids)} movies, skipped duplicates in batch")
-            return inserted_ids
+            # Concurrent upserts can race on channel_message_1, and a file posted
+            # twice can collide on file_id; both count as duplicates
+            inserted = bwe.details.get("nUpserted", 0)
+            duplicates = bwe.details.get("nMatched", 0) + sum(
+                1 for err in bwe.details.get("writeErrors", []) if err.get("code") == 11000
+            )
+            logger.info("Inserted %s movies, skipped %s duplicates in batch", inserted, duplicates)
+            return inserted, duplicates
         except PyMongoError as e:
             attempt += 1
             if attempt == retries:
-                logger.error(f"Failed to add movie batch after {retries} attempts: {str(e)}")
+                logger.error("Failed to add movie batch after %s attempts: %s", retries, e)
                 raise
-            logger.warning(f"Retrying add_movies_batch (attempt {attempt + 1}): {str(e)}")
+            logger.warning("Retrying add_movies_batch (attempt %s): %s", attempt + 1, e)
             continue
-    return []
+    return 0, 0
+
+async def get_collection_counts():
+    """Return (total users, total movies) from collection metadata, cached for STATS_CACHE_TTL seconds."""
+    global _stats_cache
+    cached_at, counts = _stats_cache
+    if counts and time.monotonic() - cached_at < STATS_CACHE_TTL:
+        return counts
 
-def get_movie_by_id(movie_id):
+    async with _stats_lock:
+        cached_at, counts = _stats_cache
+        if counts and time.monotonic() - cached_at < STATS_CACHE_TTL:
+            return counts
+
+        try:
+            counts = (
+                await users_collection.estimated_document_count(),
+                await movies_collection.estimated_document_count()
+            )
+            _stats_cache = (time.monotonic(), counts)
+            return counts
+        except PyMongoError as e:
+            logger.error("Error counting documents: %s", e)
+            raise
+
+async def get_index_bookmark(channel_id):
+    """Return (highest message id read, message ids to retry) for a channel."""
+    try:
+        channel = await channels_collection.find_one(
+            {"channel_id": channel_id}, {"_id": 0, "last_message_id": 1, "failed_message_ids": 1}
+        )
+        if not channel:
+            return 0, []
+        return channel.get("last_message_id", 0), channel.get("failed_message_ids", [])
+    except PyMongoError as e:
+        logger.error("Error reading index bookmark for channel %s: %s", channel_id, e)
+        raise
+
+async def save_index_bookmark(channel_id, message_id, failed_ids):
+    """Advance a channel's index bookmark, never backwards, and replace its retry list."""
+    try:
+        await channels_collection.update_one(
+            {"channel_id": channel_id},
+            {"$max": {"last_message_id": message_id}, "$set": {"failed_message_ids": failed_ids}},
+            upsert=True
+        )
+    except PyMongoError as e:
+        logger.error("Error saving index bookmark for channel %s: %s", channel_id, e)
+        raise
+
+async def get_movie_by_id(movie_id):
     """Retrieve a movie by its ID."""
     try:
-        movie = movies_collection.find_one({"_id": ObjectId(movie_id)})
+        movie = await movies_collection.find_one({"_id": ObjectId(movie_id)})
         if movie:
             return movie
-        logger.warning(f"Movie with ID {movie_id} not found")
+        logger.warning("Movie with ID %s not found", movie_id)
         return None
     except PyMongoError as e:
-        logger.error(f"Error retrieving movie {movie_id}: {str(e)}")
+        logger.error("Error retrieving movie %s: %s", movie_id, e)
         raise
 
-def search_movies(title, year=None, language=None, limit=10):
-    """Search for movies by title, with optional year and language filters."""
+def _movie_row(movie):
+    """Convert a projected movie document into the tuple returned by queries."""
+    return (
+        str(movie["_id"]),
+        movie["title"],
+        movie["year"],
+        movie["quality"],
+        movie_file_size(movie),
+        movie["file_id"],
+        movie["message_id"],
+        movie.get("channel_id"),  # Use .get() to handle missing channel_id
+        movie.get("language")  # Include language for display
+    )
+
+async def search_movies(title, year=None, language=None, limit=10, after_id=None):
+    """Search for movies by title, with optional year and language filters.
+
+    Returns (results, next_cursor). Results are ordered by _id; next_cursor is
+    the id of the last result when another page exists, else None. Pass it as
+    after_id to fetch that page, which walks the _id index instead of using
+    skip(). One extra document is fetched to detect a next page, so no count
+    query is ever needed; callers offer "Next" rather than page numbers.
+
+    Titles are matched through the precomputed phraselist: a query of up to
+    PHRASE_MAX_WORDS words must appear as a phrase in the title, a longer one
+    must contain every word. When there are title words, only that clause is
+    sent to MongoDB so the planner stays on phraselist_id_1; year and language
+    are checked here, reading further windows of TITLE_CANDIDATE_LIMIT
+    matches until the page is full or the title matches run out.
+    """
+    words = _query_words(title)
+    if not words and not year and not language:
+        logger.info("Skipping search with no searchable terms: title=%s", title)
+        return [], None
+
+    if language:
+        language = language.lower()
+
     try:
-        query = {"$text": {"$search": title}}
-        if year:
-            query["year"] = year
-        if language:
-            query["language"] = language
+        query = {}
+        if words:
+            if len(words) <= PHRASE_MAX_WORDS:
+                query["phraselist"] = " ".join(words)
+            else:
+                query["phraselist"] = {"$all": list(words)}
+            fetch_limit = max(limit + 1, TITLE_CANDIDATE_LIMIT)
+            index_hint = "phraselist_id_1"
+        else:
+            if year:
+                query["year"] = year
+            if language:
+                query["language"] = language
+            fetch_limit = limit + 1
+            # lang_year_id_1 only yields _id order with both equality fields bound
+            index_hint = "lang_year_id_1" if language and year else None
 
-        movies = movies_collection.find(query).limit(limit)
         results = []
-        for movie in movies:
-            results.append((
-                str(movie["_id"]),
-                movie["title"],
-                movie["year"],
-                movie["quality"],
-                movie["file_size"],
-                movie["file_id"],
-                movie["message_id"],
-                movie.get("channel_id"),  # Use .get() to handle missing channel_id
-                movie.get("language")  # Include language for display
-            ))
-        logger.info(f"Found {len(results)} movies for query: title={title}, year={year}, language={language}")
-        return results
+        scanned_id = ObjectId(after_id) if after_id else None
+        while True:
+            if scanned_id:
+                query["_id"] = {"$gt": scanned_id}
+            cursor = (
+                movies_collection.find(query, projection=SEARCH_PROJECTION)
+                .sort("_id", 1)
+                .limit(fetch_limit)
+                .batch_size(fetch_limit)
+            )
+            # The _id sort makes the planner weigh the _id index against the
+            # filter index; pin the filter index, which also supplies the sort,
+            # so a page never scans the whole _id index or sorts in memory.
+            if index_hint:
+                cursor = cursor.hint(index_hint)
+            scanned = 0
+            async for movie in cursor:
+                scanned += 1
+                scanned_id = movie["_id"]
+                if words and ((year and movie["year"] != year) or (language and movie.get("language") != language)):
+                    continue
+                results.append(_movie_row(movie))
+                if len(results) > limit:
+                    break
+            # A short window means there are no more matches past it
+            if len(results) > limit or scanned < fetch_limit:
+                break
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            next_cursor = results[-1][0]
+        logger.info("Found %s movies for query: title=%s, year=%s, language=%s, after_id=%s", len(results), title, year, language, after_id)
+        return results, next_cursor
     except PyMongoError as e:
-        logger.error(f"Error searching movies: title={title}, year={year}, language={language}, error={str(e)}")
+        logger.error("Error searching movies: title=%s, year=%s, language=%s, error=%s", title, year, language, e)
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in search_movies: {str(e)}")
+        logger.error("Unexpected error in search_movies: %s", e)
         raise
@@ -1,50 +1,112 @@
-import os
+import re
 import time
+import functools
 import logging
 import asyncio
 from PIL import Image
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.error import TelegramError, BadRequest
+from telegram.error import TelegramError, BadRequest, RetryAfter
 from telegram.ext import ConversationHandler
 from database import (
-    add_user, update_user_settings, get_user_settings, add_movie, add_movies_batch, search_movies, movies_collection, users_collection, get_movie_by_id
+    add_user, update_user_settings, get_user_settings, add_movies_batch, build_movie_doc, search_movies, get_movie_by_id, get_collection_counts, movie_file_size,
+    get_index_bookmark, save_index_bookmark
 )
-from utils import fix_thumb, process_file
+from utils import fix_thumb, process_file, telethon_client
+from config import OWNER_NAME
 from telegram.error import NetworkError
-from telethon import TelegramClient
-from telethon.sessions import StringSession
 from telethon.errors import FloodWaitError, ChannelPrivateError, AuthKeyError, RPCError
-from bson.objectid import ObjectId
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 # Conversation states
 SET_THUMBNAIL, SET_PREFIX, SET_CAPTION = range(3)
 
+# Indexing runs share one Telethon connection, so they take turns
+INDEX_LOCK = asyncio.Lock()
+
+# Database flushes allowed in flight while indexing keeps reading the channel
+FLUSH_CONCURRENCY = 2
+
+# Forward/delete round trips for file ids allowed in flight while indexing
+RESOLVE_CONCURRENCY = 8
+
+# Minimum seconds between progress message edits while indexing
+PROGRESS_EDIT_INTERVAL = 3.0
+
+# Rate-limit waits slept through per call or indexing run, and the longest one worth waiting for
+FLOOD_WAIT_RETRIES = 3
+FLOOD_WAIT_MAX = 300
+
+# Edits must resend the markup or Telegram removes the Cancel button
+INDEX_CANCEL_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton('Cancel', callback_data='index_cancel')]]
+)
+
+# Channel admin ids cached per channel to skip repeated getChatAdministrators calls
+ADMIN_CACHE_TTL = 300
+_admin_cache = {}
+# Caps concurrent getChatAdministrators calls on cache misses
+_admin_lookup_sem = asyncio.Semaphore(5)
+
+# Channel and supergroup ids carry the -100 prefix, so all of them sit below this
+CHANNEL_ID_LIMIT = -10**12
+
+# Results messages per user whose search is kept for the "Next" button
+SEARCH_HISTORY_SIZE = 20
+
+# Languages recognised in file names and search queries
+LANGUAGES = ('tamil', 'english', 'hindi')
+
+# <title>_<year>_<quality>[_...].mkv; dots in the title stand for spaces
+FILE_NAME_RE = re.compile(
+    r"(?P<title>[^_]*?)(?:_(?P<year>[^_]*?))?(?:_(?P<quality>[^_]*?))?(?:_[^_]*?)*(?:\.mkv)?",
+    re.IGNORECASE
+)
+LANGUAGE_RE = re.compile("|".join(LANGUAGES), re.IGNORECASE)
+
+WELCOME_TEXT = (
+    "Welcome to the Movie Bot! 🎥\n"
+    "Just type a movie name (e.g., 'Mitra 2025' or 'Mitra tamil') to search for movies.\n"
+    "Customize your downloads:\n"
+    "  /setthumbnail - Set a custom thumbnail\n"
+    "  /setprefix - Set a filename prefix\n"
+    "  /setcaption - Set a custom caption\n"
+    "View settings:\n"
+    "  /viewthumbnail - See your thumbnail\n"
+    "  /viewprefix - See your prefix\n"
+    "  /viewcaption - See your caption\n"
+    "Admin: Use /index and forward a message from a channel where I'm an admin to index all MKV files.\n"
+    "All movies are legal, public domain content."
+)
+
+STATS_TEMPLATE = (
+    "📊 *Movie Bot Stats* 📊\n\n"
+    "👥 *Total Users*: {total_users}\n"
+    "🎥 *Total Movies*: {total_files}\n"
+    "🌐 *Bot Language*: {bot_language}\n"
+    "👤 *Owner*: {owner_name}\n\n"
+    "Thank you for using Movie Bot! 🎉"
+)
+
+def parse_file_name(file_name):
+    """Split an MKV file name into title, year, quality and language"""
+    match = FILE_NAME_RE.fullmatch(file_name)
+    year = match.group('year')
+    quality = match.group('quality')
+    language = LANGUAGE_RE.search(file_name)
+    return (
+        match.group('title').replace('.', ' ').strip(),
+        int(year) if year and year.isdigit() else 0,
+        quality if quality is not None else 'Unknown',
+        language.group(0).lower() if language else None
+    )
+
 async def start(update, context):
     """Send welcome message when command /start is issued"""
     chat_id = update.message.chat_id
-    add_user(chat_id)
-    await update.message.reply_text(
-        "Welcome to the Movie Bot! 🎥\n"
-        "Just type a movie name (e.g., 'Mitra 2025' or 'Mitra tamil') to search for movies.\n"
-        "Customize your downloads:\n"
-        "  /setthumbnail - Set a custom thumbnail\n"
-        "  /setprefix - Set a filename prefix\n"
-        "  /setcaption - Set a custom caption\n"
-        "View settings:\n"
-        "  /viewthumbnail - See your thumbnail\n"
-        "  /viewprefix - See your prefix\n"
-        "  /viewcaption - See your caption\n"
-        "Admin: Use /index and forward a message from a channel where I'm an admin to index all MKV files.\n"
-        "All movies are legal, public domain content."
-    )
-    logger.info(f"User {chat_id} started the bot")
+    await add_user(chat_id)
+    await update.message.reply_text(WELCOME_TEXT)
+    logger.info("User %s started the bot", chat_id)
 
 async def index(update, context):
     """Initiate channel indexing process (single or batch)"""
@@ -52,17 +114,82 @@ async def index(update, context):
     await update.message.reply_text(
         "Please forward a message from a channel where I am an admin to index MKV files.\n"
         "Reply with 'batch' to index in batches or 'single' for single-pass indexing.",
-        reply_markup=InlineKeyboardMarkup(
-            [[InlineKeyboardButton('Cancel', callback_data='index_cancel')]]
-        )
+        reply_markup=INDEX_CANCEL_MARKUP
     )
     context.user_data['indexing'] = True
     context.user_data['index_channel_id'] = None
     context.user_data['index_mode'] = None
-    logger.info(f"User {chat_id} initiated indexing")
+    logger.info("User %s initiated indexing", chat_id)
+
+async def get_channel_admin_ids(bot, channel_id):
+    """Return the set of admin user ids for a channel, cached for ADMIN_CACHE_TTL seconds"""
+    cached = _admin_cache.get(channel_id)
+    if cached and time.monotonic() - cached[0] < ADMIN_CACHE_TTL:
+        return cached[1]
+
+    async with _admin_lookup_sem:
+        # Another request may have filled the cache while this one waited
+        cached = _admin_cache.get(channel_id)
+        if cached and time.monotonic() - cached[0] < ADMIN_CACHE_TTL:
+            return cached[1]
+
+        admins = await bot.get_chat_administrators(channel_id)
+        admin_ids = {admin.user.id for admin in admins}
+        _admin_cache[channel_id] = (time.monotonic(), admin_ids)
+        return admin_ids
+
+async def with_flood_retry(func, *args, **kwargs):
+    """Await a Telegram API call, sleeping through rate limits up to FLOOD_WAIT_RETRIES times"""
+    attempt = 0
+    while True:
+        try:
+            return await func(*args, **kwargs)
+        except (RetryAfter, FloodWaitError) as e:
+            wait = e.retry_after if isinstance(e, RetryAfter) else e.seconds
+            attempt += 1
+            if attempt > FLOOD_WAIT_RETRIES or wait > FLOOD_WAIT_MAX:
+                raise
+            logger.warning("Rate limited for %s seconds, retrying", wait)
+            await asyncio.sleep(wait + 1)
+
+async def resolve_file_id(context, msg, channel_id, chat_id):
+    """Get the bot's own file_id for a channel document by forwarding it to the user"""
+    # Bot API file_ids are specific to the bot, so they cannot be derived from the
+    # Telethon user session's document; the bot has to see the message itself
+    forwarded = await with_flood_retry(
+        context.bot.forward_message,
+        chat_id=chat_id,  # Forward to user
+        from_chat_id=channel_id,
+        message_id=msg.id
+    )
+    file_id = forwarded.document.file_id if forwarded.document else None
+    await with_flood_retry(context.bot.delete_message, chat_id=chat_id, message_id=forwarded.message_id)
+    return file_id
 
-async def batch_index(client, channel_id, progress_msg, context, chat_id, batch_size=100, max_messages=1000):
-    """Process channel messages in batches to index MKV files"""
+async def flush_movie_batch(movie_batch, semaphore):
+    """Insert a batch of movie documents and return (batch size, inserted, duplicates)"""
+    async with semaphore:
+        try:
+            inserted, skipped = await add_movies_batch(movie_batch)
+        except Exception as e:
+            logger.error("Failed to insert batch of %s movies: %s", len(movie_batch), e)
+            inserted, skipped = 0, 0
+    return len(movie_batch), inserted, skipped
+
+async def edit_progress(bot, progress_msg, text):
+    """Edit the indexing progress message, ignoring failures"""
+    try:
+        await bot.edit_message_text(
+            chat_id=progress_msg.chat_id,
+            message_id=progress_msg.message_id,
+            text=text,
+            reply_markup=INDEX_CANCEL_MARKUP
+        )
+    except TelegramError as e:
+        logger.debug("Progress update skipped: %s", e)
+
+async def index_channel(client, channel_id, progress_msg, context, chat_id, mode, batch_size=100, max_messages=1000, flush_size=500):
+    """Index MKV files from a channel; batch mode pauses between batches of messages"""
     total_files = 0
     duplicate = 0
     errors = 0
@@ -70,342 +197,315 @@ async def batch_index(client, channel_id, progress_msg, context, chat_id, batch_
     current = 0
     batch_number = 0
     movie_batch = []
+    flushes = []
+    flush_sem = asyncio.Semaphore(FLUSH_CONCURRENCY)
+    resolves = set()
+    resolve_sem = asyncio.Semaphore(RESOLVE_CONCURRENCY)
+    progress_task = None
+    last_edit = 0.0
+    # Messages whose movie was not stored this run; saved for the next run to retry
+    failed_ids = set()
+
+    def record_flush(message_ids, task):
+        # Counts are added as each flush lands so progress edits show them
+        nonlocal total_files, duplicate, errors
+        if task.cancelled():
+            return
+        batch_len, inserted, skipped = task.result()
+        total_files += inserted
+        duplicate += skipped
+        errors += batch_len - inserted - skipped
+        if inserted + skipped < batch_len:
+            # The batch result does not say which rows failed, so all of them are retried
+            failed_ids.update(message_ids)
+
+    def start_flush(batch):
+        task = asyncio.create_task(flush_movie_batch(batch, flush_sem))
+        task.add_done_callback(functools.partial(record_flush, [movie["message_id"] for movie in batch]))
+        flushes.append(task)
+
+    async def stage_movie(msg, file_name, title, year, quality, language):
+        # Runs as a task holding a resolve_sem slot, taken by the loop, until the forward is done
+        nonlocal movie_batch, errors, unsupported
+        try:
+            file_id = await resolve_file_id(context, msg, channel_id, chat_id)
+        except (TelegramError, BadRequest) as te:
+            logger.error("Error getting file ID for %s: %s", file_name, te)
+            errors += 1
+            failed_ids.add(msg.id)
+            return
+        except Exception as e:
+            logger.error("Error processing message %s: %s", msg.id, e)
+            errors += 1
+            failed_ids.add(msg.id)
+            return
+        finally:
+            resolve_sem.release()
 
-    try:
-        async for msg in client.iter_messages(int(channel_id), limit=max_messages):
-            if not context.user_data.get('indexing'):
-                break
+        if not file_id:
+            unsupported += 1
+            return
 
-            current += 1
-            if current % batch_size == 1:
-                batch_number += 1
-                await context.bot.edit_message_text(
-                    chat_id=progress_msg.chat_id,
-                    message_id=progress_msg.message_id,
-                    text=(
-                        f"Batch {batch_number} in progress...\n"
-                        f"Messages processed: {current}\n"
-                        f"Movies indexed: {total_files}\n"
-                        f"Duplicates skipped: {duplicate}\n"
-                        f"Unsupported skipped: {unsupported}"
-                    )
-                )
+        movie_batch.append(build_movie_doc(
+            title=title,
+            year=year,
+            quality=quality,
+            file_size_bytes=msg.document.size,
+            file_id=file_id,
+            message_id=msg.id,
+            language=language,
+            channel_id=channel_id
+        ))
+        if len(movie_batch) >= flush_size:
+            start_flush(movie_batch)
+            movie_batch = []
+
+    async def index_message(msg):
+        nonlocal current, batch_number, last_edit, progress_task, errors, unsupported
+        current += 1
+        if current % batch_size == 1:
+            batch_number += 1
+
+        # Progress edits run in the background, at most one per interval
+        now = time.monotonic()
+        if now - last_edit >= PROGRESS_EDIT_INTERVAL and (not progress_task or progress_task.done()):
+            last_edit = now
+            status = f"Batch {batch_number} in progress..." if mode == 'batch' else "Single-pass indexing in progress..."
+            progress_task = asyncio.create_task(edit_progress(
+                context.bot, progress_msg,
+                f"{status}\n"
+                f"Messages processed: {current}\n"
+                f"Movies indexed: {total_files}\n"
+                f"Duplicates skipped: {duplicate}\n"
+                f"Unsupported skipped: {unsupported}"
+            ))
 
-            try:
-                if not msg.document or msg.document.mime_type != 'video/x-matroska':
-                    unsupported += 1
-                    continue
-
-                file_name = msg.document.attributes[-1].file_name
-                message_id = msg.id
-
-                language = None
-                name_lower = file_name.lower()
-                if 'tamil' in name_lower:
-                    language = 'tamil'
-                elif 'english' in name_lower:
-                    language = 'english'
-                elif 'hindi' in name_lower:
-                    language = 'hindi'
-
-                try:
-                    forwarded = await context.bot.forward_message(
-                        chat_id=chat_id,  # Forward to user
-                        from_chat_id=channel_id,
-                        message_id=message_id
-                    )
-                    if not forwarded.document:
-                        unsupported += 1
-                        await context.bot.delete_message(chat_id=chat_id, message_id=forwarded.message_id)
-                        continue
-                    file_id = forwarded.document.file_id
-                    await context.bot.delete_message(chat_id=chat_id, message_id=forwarded.message_id)
-                except (TelegramError, BadRequest) as te:
-                    logger.error(f"Error getting file ID for {file_name}: {str(te)}")
-                    errors += 1
-                    continue
-
-                try:
-                    clean_name = file_name.replace('.mkv', '').split('_')
-                    title = clean_name[0].replace('.', ' ').strip()
-                    year = int(clean_name[1]) if len(clean_name) > 1 and clean_name[1].isdigit() else 0
-                    quality = clean_name[2] if len(clean_name) > 2 else 'Unknown'
-
-                    size_bytes = msg.document.size
-                    if size_bytes >= 1024 * 1024 * 1024:
-                        file_size = f"{size_bytes / (1024 * 1024 * 1024):.2f}GB"
-                    else:
-                        file_size = f"{size_bytes / (1024 * 1024):.2f}MB"
-
-                    movie_doc = {
-                        "title": title,
-                        "year": year,
-                        "quality": quality,
-                        "file_size": file_size,
-                        "file_id": file_id,
-                        "message_id": message_id,
-                        "channel_id": channel_id
-                    }
-                    if language:
-                        movie_doc["language"] = language
-                    movie_batch.append(movie_doc)
-
-                    if len(movie_batch) >= batch_size:
-                        inserted_ids = add_movies_batch(movie_batch)
-                        total_files += len(inserted_ids)
-                        duplicate += batch_size - len(inserted_ids)
-                        movie_batch = []
-
-                except (IndexError, ValueError, AttributeError) as e:
-                    logger.warning(f"Error parsing {file_name}: {str(e)}")
-                    errors += 1
+        try:
+            if not msg.document or msg.document.mime_type != 'video/x-matroska':
+                unsupported += 1
+                return
+
+            # Videos carry more attributes than files, so look the name attribute up by type
+            file_name = msg.file.name
+            if not file_name:
+                unsupported += 1
+                return
+            title, year, quality, language = parse_file_name(file_name)
+
+            # Forwarding costs two Bot API round trips, so several run at once;
+            # waiting for a free slot keeps the channel walk from racing ahead
+            await resolve_sem.acquire()
+            task = asyncio.create_task(stage_movie(msg, file_name, title, year, quality, language))
+            resolves.add(task)
+            task.add_done_callback(resolves.discard)
 
-            except Exception as e:
-                logger.error(f"Error processing message {message_id}: {str(e)}")
-                errors += 1
-                continue
+        except Exception as e:
+            logger.error("Error processing message %s: %s", msg.id, e)
+            errors += 1
+            failed_ids.add(msg.id)
+            return
 
-            if current % batch_size == 0:
-                await asyncio.sleep(5)
+        if mode == 'batch' and current % batch_size == 0:
+            await asyncio.sleep(5)
+
+    # Resume after the last message a previous run reached, walking oldest first
+    # so the bookmark only ever covers messages that were actually read
+    min_id, retry_ids = await get_index_bookmark(channel_id)
+    last_id = min_id
+    retried_ids = set()
+    flood_waits = 0
+
+    try:
+        # A flood wait restarts the walk after the last message read, up to a few times
+        while True:
+            try:
+                # Messages that failed in earlier runs are retried before the walk goes on
+                pending_retry = [message_id for message_id in retry_ids if message_id not in retried_ids]
+                if pending_retry:
+                    for message_id, msg in zip(pending_retry, await client.get_messages(channel_id, ids=pending_retry)):
+                        if not context.user_data.get('indexing'):
+                            break
+                        retried_ids.add(message_id)
+                        if msg:  # None when the message was deleted since
+                            await index_message(msg)
+
+                # No server-side filter: the Files filter leaves out MKVs posted as video,
+                # and the bookmark would move past them; the mime check picks them out here
+                async for msg in client.iter_messages(
+                    channel_id, limit=max_messages - current, min_id=last_id, reverse=True
+                ):
+                    if not context.user_data.get('indexing'):
+                        break
+                    last_id = msg.id
+                    await index_message(msg)
 
-        # Insert any remaining movies in the batch
+                break
+            except FloodWaitError as fwe:
+                flood_waits += 1
+                if flood_waits > FLOOD_WAIT_RETRIES or fwe.seconds > FLOOD_WAIT_MAX:
+                    raise
+                logger.warning("Flood wait of %s seconds after %s messages in channel %s, resuming", fwe.seconds, current, channel_id)
+                await asyncio.sleep(fwe.seconds + 1)
+
+    # A flood wait past the retries propagates once the work already read is saved
+    finally:
+        # Let the forwards in flight stage their movies, then insert the rest
+        # and wait for the flushes still in flight
+        if resolves:
+            await asyncio.gather(*resolves)
         if movie_batch:
-            inserted_ids = add_movies_batch(movie_batch)
-            total_files += len(inserted_ids)
-            duplicate += len(movie_batch) - len(inserted_ids)
+            start_flush(movie_batch)
+        # record_flush runs before gather returns, as it was registered first
+        await asyncio.gather(*flushes)
+
+        # The bookmark moves past failed messages so one bad file cannot pin every
+        # later run; they are kept on the channel and retried first next time
+        still_failed = sorted(failed_ids | (set(retry_ids) - retried_ids))
+        if still_failed:
+            logger.warning("%s messages in channel %s will be retried on the next run", len(still_failed), channel_id)
+        if last_id > min_id or still_failed != sorted(retry_ids):
+            try:
+                await save_index_bookmark(channel_id, last_id, still_failed)
+            except Exception as e:
+                logger.error("Failed to save index bookmark for channel %s: %s", channel_id, e)
 
-    except FloodWaitError as fwe:
-        logger.error(f"Flood wait error in batch {batch_number}: {fwe.seconds} seconds")
-        await context.bot.edit_message_text(
-            chat_id=progress_msg.chat_id,
-            message_id=progress_msg.message_id,
-            text=f"Flood wait error: Please wait {fwe.seconds} seconds before trying again."
-        )
-    except Exception as e:
-        logger.error(f"Error in batch {batch_number}: {str(e)}")
-        errors += 1
+        # Let the last progress edit land before the caller writes the final report
+        if progress_task:
+            await progress_task
 
     return total_files, duplicate, errors, unsupported, current
 
+async def cancel_indexing(update, context):
+    """Stop a running or pending indexing session from its Cancel button"""
+    query = update.callback_query
+    context.user_data['indexing'] = False
+    context.user_data['index_channel_id'] = None
+    context.user_data['index_mode'] = None
+    await query.answer()
+    await query.message.edit_text("Indexing cancelled.")
+    logger.info("User %s cancelled indexing", query.from_user.id)
+
 async def handle_forwarded_message(update, context):
     """Process forwarded message for channel indexing (single or batch)"""
-    chat_id = update.message.chat_id
-
-    if update.callback_query and update.callback_query.data == 'index_cancel':
-        context.user_data['indexing'] = False
-        context.user_data['index_channel_id'] = None
-        context.user_data['index_mode'] = None
-        await update.callback_query.message.edit_text("Indexing cancelled.")
-        logger.info(f"User {chat_id} cancelled indexing")
-        return
+    message = update.message
+    chat_id = message.chat_id
+    bot = context.bot
 
     if not context.user_data.get('indexing'):
         return
 
     # Check if user specified indexing mode
     if not context.user_data.get('index_mode'):
-        if update.message.text.lower() in ['batch', 'single']:
-            context.user_data['index_mode'] = update.message.text.lower()
-            await update.message.reply_text(
-                f"{context.user_data['index_mode'].capitalize()} indexing selected. "
+        mode = (message.text or '').lower()
+        if mode in ['batch', 'single']:
+            context.user_data['index_mode'] = mode
+            await message.reply_text(
+                f"{mode.capitalize()} indexing selected. "
                 "Now forward a message from the channel to index."
             )
-            logger.info(f"User {chat_id} selected {context.user_data['index_mode']} indexing")
+            logger.info("User %s selected %s indexing", chat_id, mode)
             return
         else:
-            await update.message.reply_text(
+            await message.reply_text(
                 "Please specify 'batch' or 'single' for indexing mode."
             )
-            logger.warning(f"User {chat_id} provided invalid indexing mode")
+            logger.warning("User %s provided invalid indexing mode", chat_id)
             return
 
+    forward_from_chat = message.forward_from_chat
+    forward_date = message.forward_date
+
     # Log forwarded message details for debugging
-    logger.debug(f"Forwarded message details: "
-                f"forward_from_chat={getattr(update.message, 'forward_from_chat', None)}, "
-                f"forward_from_message_id={getattr(update.message, 'forward_from_message_id', None)}, "
-                f"forward_date={getattr(update.message, 'forward_date', None)}, "
-                f"chat_id={update.message.chat.id}, "
-                f"message_id={update.message.message_id}")
+    logger.debug(
+        "Forwarded message details: forward_from_chat=%s, forward_from_message_id=%s, "
+        "forward_date=%s, chat_id=%s, message_id=%s",
+        forward_from_chat, message.forward_from_message_id, forward_date,
+        message.chat.id, message.message_id
+    )
 
     # Check if the message is forwarded
-    if not update.message.forward_date:
-        await update.message.reply_text("Please forward a message from a channel.")
-        logger.warning(f"User {chat_id} sent a non-forwarded message")
+    if not forward_date:
+        await message.reply_text("Please forward a message from a channel.")
+        logger.warning("User %s sent a non-forwarded message", chat_id)
         return
 
     # Check for channel message using forward_from_chat
     forwarded_channel_id = None
-    if hasattr(update.message, 'forward_from_chat') and update.message.forward_from_chat and update.message.forward_from_chat.type == 'channel':
-        forwarded_channel_id = str(update.message.forward_from_chat.id)
-    elif str(update.message.chat.id).startswith('-100'):
-        forwarded_channel_id = str(update.message.chat.id)
-        logger.info(f"Using fallback channel ID {forwarded_channel_id} for user {chat_id}")
+    if forward_from_chat and forward_from_chat.type == 'channel':
+        forwarded_channel_id = forward_from_chat.id
+    elif message.chat.id < CHANNEL_ID_LIMIT:
+        forwarded_channel_id = message.chat.id
+        logger.info("Using fallback channel ID %s for user %s", forwarded_channel_id, chat_id)
 
     if not forwarded_channel_id:
-        await update.message.reply_text("Please forward a message directly from a channel.")
-        logger.warning(f"User {chat_id} forwarded a non-channel message: "
-                      f"forward_from_chat={getattr(update.message, 'forward_from_chat', None)}")
+        await message.reply_text("Please forward a message directly from a channel.")
+        logger.warning("User %s forwarded a non-channel message: forward_from_chat=%s", chat_id, forward_from_chat)
         return
 
-    if not forwarded_channel_id.startswith('-100'):
-        await update.message.reply_text("Invalid channel ID. Please forward a message from a valid Telegram channel.")
-        logger.warning(f"Invalid channel ID {forwarded_channel_id} for user {chat_id}")
+    if forwarded_channel_id >= CHANNEL_ID_LIMIT:
+        await message.reply_text("Invalid channel ID. Please forward a message from a valid Telegram channel.")
+        logger.warning("Invalid channel ID %s for user %s", forwarded_channel_id, chat_id)
         return
 
-    logger.info(f"User {chat_id} forwarded message from channel {forwarded_channel_id}")
+    logger.info("User %s forwarded message from channel %s", chat_id, forwarded_channel_id)
+
+    # Forwards are handled concurrently; set before the first await so a second
+    # forward cannot start another run that would share this user's flags
+    if context.user_data.get('index_running'):
+        await message.reply_text("Indexing is already running. Wait for it to finish or cancel it first.")
+        logger.warning("User %s forwarded a channel while indexing was running", chat_id)
+        return
+    context.user_data['index_running'] = True
 
     try:
         # Verify bot is admin
-        admins = await context.bot.get_chat_administrators(forwarded_channel_id)
-        bot_id = context.bot.id
-        if not any(admin.user.id == bot_id for admin in admins):
-            await update.message.reply_text("I am not an admin of this channel. Please make me an admin and try again.")
-            logger.warning(f"Bot is not admin of channel {forwarded_channel_id} for user {chat_id}")
+        admin_ids = await get_channel_admin_ids(bot, forwarded_channel_id)
+        if bot.id not in admin_ids:
+            await message.reply_text("I am not an admin of this channel. Please make me an admin and try again.")
+            logger.warning("Bot is not admin of channel %s for user %s", forwarded_channel_id, chat_id)
             return
 
         # Verify user is admin
-        if not any(admin.user.id == chat_id for admin in admins):
-            await update.message.reply_text("Only channel admins can index movies.")
-            logger.warning(f"User {chat_id} is not admin of channel {forwarded_channel_id}")
+        if chat_id not in admin_ids:
+            await message.reply_text("Only channel admins can index movies.")
+            logger.warning("User %s is not admin of channel %s", chat_id, forwarded_channel_id)
             return
 
         context.user_data['index_channel_id'] = forwarded_channel_id
-        logger.info(f"User {chat_id} set indexing channel to {forwarded_channel_id}")
+        logger.info("User %s set indexing channel to %s", chat_id, forwarded_channel_id)
 
         # Initialize progress message
-        progress_msg = await update.message.reply_text(
+        progress_msg = await message.reply_text(
             f"Starting {context.user_data['index_mode']} indexing process...",
-            reply_markup=InlineKeyboardMarkup(
-                [[InlineKeyboardButton('Cancel', callback_data='index_cancel')]]
-            )
+            reply_markup=INDEX_CANCEL_MARKUP
         )
 
-        # Set up Telethon client with user session
-        api_id = os.getenv("TELEGRAM_API_ID")
-        api_hash = os.getenv("TELEGRAM_API_HASH")
-        session_string = os.getenv("TELETHON_SESSION_STRING")
-
-        if not all([api_id, api_hash, session_string]):
-            missing = [var for var, val in [
-                ("TELEGRAM_API_ID", api_id),
-                ("TELEGRAM_API_HASH", api_hash),
-                ("TELETHON_SESSION_STRING", session_string)
-            ] if not val]
-            error_msg = f"Missing environment variables: {', '.join(missing)}"
-            await update.message.reply_text(f"Configuration error: {error_msg}")
-            logger.error(f"Indexing failed for channel {forwarded_channel_id}: {error_msg}")
+        # Channel history is read through the Telethon client connected at startup
+        if not telethon_client or not telethon_client.is_connected():
+            error_msg = "Telethon client is not connected (check TELEGRAM_API_ID, TELEGRAM_API_HASH and TELETHON_SESSION_STRING)"
+            await message.reply_text(f"Configuration error: {error_msg}")
+            logger.error("Indexing failed for channel %s: %s", forwarded_channel_id, error_msg)
             return
 
+        # The Cancel button clears user_data while the run is pending or in progress
+        mode = context.user_data['index_mode']
+
+        if INDEX_LOCK.locked():
+            await message.reply_text("Another indexing run is in progress; this one will start when it finishes.")
+        await INDEX_LOCK.acquire()
         try:
-            client = TelegramClient(StringSession(session_string), int(api_id), api_hash)
-            await client.start()
-            logger.info("TelegramClient authenticated successfully")
-
-            total_files = 0
-            duplicate = 0
-            errors = 0
-            unsupported = 0
-            current = 0
-
-            if context.user_data['index_mode'] == 'batch':
-                total_files, duplicate, errors, unsupported, current = await batch_index(
-                    client, forwarded_channel_id, progress_msg, context, chat_id
-                )
-            else:
-                # Single-pass indexing
-                max_messages = 1000
-                async for msg in client.iter_messages(int(forwarded_channel_id), limit=max_messages):
-                    if not context.user_data.get('indexing'):
-                        break
+            if not context.user_data.get('indexing'):
+                logger.info("User %s cancelled indexing before it started", chat_id)
+                return
+            client = telethon_client
 
-                    current += 1
-                    try:
-                        if current % 20 == 0:
-                            await context.bot.edit_message_text(
-                                chat_id=progress_msg.chat_id,
-                                message_id=progress_msg.message_id,
-                                text=(
-                                    f"Single-pass indexing in progress...\n"
-                                    f"Messages processed: {current}\n"
-                                    f"Movies indexed: {total_files}\n"
-                                    f"Duplicates skipped: {duplicate}\n"
-                                    f"Unsupported skipped: {unsupported}"
-                                )
-                            )
-
-                        if not msg.document or msg.document.mime_type != 'video/x-matroska':
-                            unsupported += 1
-                            continue
-
-                        file_name = msg.document.attributes[-1].file_name
-                        message_id = msg.id
-
-                        language = None
-                        name_lower = file_name.lower()
-                        if 'tamil' in name_lower:
-                            language = 'tamil'
-                        elif 'english' in name_lower:
-                            language = 'english'
-                        elif 'hindi' in name_lower:
-                            language = 'hindi'
-
-                        try:
-                            forwarded = await context.bot.forward_message(
-                                chat_id=chat_id,  # Forward to user
-                                from_chat_id=forwarded_channel_id,
-                                message_id=message_id
-                            )
-                            if not forwarded.document:
-                                unsupported += 1
-                                await context.bot.delete_message(chat_id=chat_id, message_id=forwarded.message_id)
-                                continue
-                            file_id = forwarded.document.file_id
-                            await context.bot.delete_message(chat_id=chat_id, message_id=forwarded.message_id)
-                        except (TelegramError, BadRequest) as te:
-                            logger.error(f"Error getting file ID for {file_name}: {str(te)}")
-                            errors += 1
-                            continue
-
-                        try:
-                            clean_name = file_name.replace('.mkv', '').split('_')
-                            title = clean_name[0].replace('.', ' ').strip()
-                            year = int(clean_name[1]) if len(clean_name) > 1 and clean_name[1].isdigit() else 0
-                            quality = clean_name[2] if len(clean_name) > 2 else 'Unknown'
-
-                            size_bytes = msg.document.size
-                            if size_bytes >= 1024 * 1024 * 1024:
-                                file_size = f"{size_bytes / (1024 * 1024 * 1024):.2f}GB"
-                            else:
-                                file_size = f"{size_bytes / (1024 * 1024):.2f}MB"
-
-                            movie_id = add_movie(
-                                title=title,
-                                year=year,
-                                quality=quality,
-                                file_size=file_size,
-                                file_id=file_id,
-                                message_id=message_id,
-                                language=language,
-                                channel_id=forwarded_channel_id
-                            )
-
-                            if movie_id:
-                                total_files += 1
-                                logger.info(f"Indexed: {title} ({year})")
-                            else:
-                                duplicate += 1
-                        except (IndexError, ValueError, AttributeError) as e:
-                            logger.warning(f"Error parsing {file_name}: {str(e)}")
-                            errors += 1
-
-                    except Exception as e:
-                        logger.error(f"Error processing message {message_id}: {str(e)}")
-                        errors += 1
-                        continue
+            total_files, duplicate, errors, unsupported, current = await index_channel(
+                client, forwarded_channel_id, progress_msg, context, chat_id, mode
+            )
 
             # Final report
             result_msg = (
-                f"✅ {context.user_data['index_mode'].capitalize()} indexing completed for channel {forwarded_channel_id}.\n"
+                f"✅ {mode.capitalize()} indexing completed for channel {forwarded_channel_id}.\n"
                 f"• Total messages processed: {current}\n"
                 f"• Movies indexed: {total_files}\n"
                 f"• Duplicates skipped: {duplicate}\n"
@@ -413,41 +513,43 @@ async def handle_forwarded_message(update, context):
                 f"• Errors occurred: {errors}"
             )
 
-            await context.bot.edit_message_text(
+            await with_flood_retry(
+                bot.edit_message_text,
                 chat_id=progress_msg.chat_id,
                 message_id=progress_msg.message_id,
                 text=result_msg
             )
-            logger.info(f"{context.user_data['index_mode'].capitalize()} indexing completed for {forwarded_channel_id}")
+            logger.info("%s indexing completed for %s", mode.capitalize(), forwarded_channel_id)
 
         except FloodWaitError as fwe:
-            await update.message.reply_text(f"Flood wait error: Please wait {fwe.seconds} seconds before trying again.")
-            logger.error(f"Flood wait error: {fwe.seconds} seconds")
+            await message.reply_text(f"Flood wait error: Please wait {fwe.seconds} seconds before trying again.")
+            logger.error("Flood wait error for channel %s: %s seconds", forwarded_channel_id, fwe.seconds)
         except ChannelPrivateError:
-            await update.message.reply_text("I don't have access to this channel. Please make sure I'm an admin.")
-            logger.error("Channel access denied")
+            await message.reply_text("I don't have access to this channel. Please make sure I'm an admin.")
+            logger.error("Channel access denied for %s", forwarded_channel_id)
         except AuthKeyError:
-            await update.message.reply_text("Authentication failed. Please check your API credentials.")
-            logger.error("Telethon authentication failed")
+            await message.reply_text("Authentication failed. Please check your API credentials.")
+            logger.error("Telethon authentication failed while indexing %s", forwarded_channel_id)
         except RPCError as rpc_error:
-            await update.message.reply_text(f"Telegram API error: {str(rpc_error)}")
-            logger.error(f"RPC Error: {str(rpc_error)}")
+            await message.reply_text(f"Telegram API error: {str(rpc_error)}")
+            logger.error("RPC Error for channel %s: %s", forwarded_channel_id, rpc_error)
         except Exception as e:
-            await update.message.reply_text(f"Unexpected error: {str(e)}")
-            logger.error(f"Indexing failed: {str(e)}", exc_info=True)
+            await message.reply_text(f"Unexpected error: {str(e)}")
+            logger.error("Indexing failed for channel %s: %s", forwarded_channel_id, e, exc_info=True)
         finally:
-            if 'client' in locals() and client.is_connected():
-                await client.disconnect()
+            INDEX_LOCK.release()
             context.user_data['indexing'] = False
             context.user_data['index_channel_id'] = None
             context.user_data['index_mode'] = None
 
     except TelegramError as te:
-        await update.message.reply_text(f"Error accessing channel: {str(te)}")
-        logger.error(f"Channel access error: {str(te)}")
+        await message.reply_text(f"Error accessing channel: {str(te)}")
+        logger.error("Channel access error for %s: %s", forwarded_channel_id, te)
         context.user_data['indexing'] = False
         context.user_data['index_channel_id'] = None
         context.user_data['index_mode'] = None
+    finally:
+        context.user_data['index_running'] = False
 
 async def search_movie(update, context):
     """Handle text-based movie search in personal messages."""
@@ -460,15 +562,15 @@ async def search_movie(update, context):
         last_query, last_time = context.bot_data['recent_searches'][chat_id]
         if query == last_query and current_time - last_time < 30:
             await update.message.reply_text("Please wait before repeating the same search.")
-            logger.info(f"User {chat_id} rate-limited for query: {query}")
+            logger.info("User %s rate-limited for query: %s", chat_id, query)
             return
     context.bot_data.setdefault('recent_searches', {})[chat_id] = (query, current_time)
 
-    logger.info(f"User {chat_id} searched for: '{query}'")
+    logger.info("User %s searched for: '%s'", chat_id, query)
 
     if not query:
         await update.message.reply_text("Please type a movie name to search (e.g., 'Mitra 2025').")
-        logger.info(f"User {chat_id} sent empty search query")
+        logger.info("User %s sent empty search query", chat_id)
         return
 
     try:
@@ -485,76 +587,108 @@ async def search_movie(update, context):
                 break
 
         # Check for language keywords
-        language_terms = ['tamil', 'english', 'hindi']
         for term in search_terms[:]:
-            if term.lower() in language_terms:
+            if term.lower() in LANGUAGES:
                 language = term.lower()
                 search_terms.remove(term)
 
         movie_name = " ".join(search_terms)
-        movies = search_movies(movie_name, year=year, language=language)
+        movies, next_cursor = await search_movies(movie_name, year=year, language=language)
 
         # Fallback: If no results with year, try without year
+        search_year = year
         if not movies and year:
-            movies = search_movies(movie_name, language=language)
-            logger.info(f"No results for '{query}' with year={year}, falling back to no year")
+            movies, next_cursor = await search_movies(movie_name, language=language)
+            search_year = None
+            logger.info("No results for '%s' with year=%s, falling back to no year", query, year)
 
         if not movies:
             await update.message.reply_text("No movies found. Try another search.")
-            logger.info(f"No movies found for query: name={movie_name}, year={year}, language={language}")
+            logger.info("No movies found for query: name=%s, year=%s, language=%s", movie_name, year, language)
             return
 
-        # Prepare the response
-        total_results = len(movies)
-        header = (
-            f"Search Query: {query}  TOTAL RESULTS: {total_results}\n\n"
-            "🔻 Tap on the file button and then start to download. 🔻\n\n"
-        )
+        message_text, reply_markup = build_results_page(query, movies, next_cursor, language)
+        results_msg = await update.message.reply_text(message_text, reply_markup=reply_markup)
 
-        # Format results
-        results = []
-        for movie_data in movies:
-            # Handle both 8 and 9 field tuples for compatibility
-            if len(movie_data) == 9:
-                movie_id, title, movie_year, quality, file_size, file_id, message_id, channel_id, movie_language = movie_data
-            else:
-                movie_id, title, movie_year, quality, file_size, file_id, message_id, channel_id = movie_data
-                movie_language = ""  # Default if language not provided
-
-            # Fetch language from DB if not in tuple
-            if not movie_language:
-                movie_doc = movies_collection.find_one({"_id": ObjectId(movie_id)})
-                movie_language = movie_doc.get('language', '') if movie_doc else ''
-
-            language_str = movie_language if movie_language else (language if language else '')
-            year_str = str(movie_year) if movie_year != 0 else ''
-            result_line = f"[{file_size}] {title} {year_str} {language_str} {quality}".strip()
-            results.append((result_line, movie_id))
-
-        # Send results as a single message with buttons
-        message_text = header + "\n".join([line for line, _ in results])
-        buttons = [
-            [InlineKeyboardButton(line, callback_data=f"download_{movie_id}")] 
-            for line, movie_id in results
-        ]
-        await update.message.reply_text(
-            message_text,
-            reply_markup=InlineKeyboardMarkup(buttons)
-        )
-        logger.info(f"Found {total_results} movies for query: name={movie_name}, year={year}, language={language}")
+        # Remember the search per results message so "Next" pages the search it belongs to
+        searches = context.user_data.setdefault('searches', {})
+        searches[results_msg.message_id] = (query, movie_name, search_year, language)
+        if len(searches) > SEARCH_HISTORY_SIZE:
+            del searches[next(iter(searches))]
+        logger.info("Found %s movies for query: name=%s, year=%s, language=%s", len(movies), movie_name, year, language)
 
     except TelegramError as te:
         await update.message.reply_text("Error occurred. Please try again later.")
-        logger.error(f"Telegram error in search '{query}' by user {chat_id}: {str(te)}")
+        logger.error("Telegram error in search '%s' by user %s: %s", query, chat_id, te)
     except Exception as e:
         await update.message.reply_text("Error occurred. Please try again later.")
-        logger.error(f"Error in search '{query}' by user {chat_id}: {str(e)}")
+        logger.error("Error in search '%s' by user %s: %s", query, chat_id, e)
+
+def build_results_page(query, movies, next_cursor, language=None):
+    """Format one page of search results as message text and download buttons"""
+    total_results = f"{len(movies)}+" if next_cursor else str(len(movies))
+    header = (
+        f"Search Query: {query}  TOTAL RESULTS: {total_results}\n\n"
+        "🔻 Tap on the file button and then start to download. 🔻\n\n"
+    )
+
+    # Format results
+    results = []
+    for movie_id, title, movie_year, quality, file_size, file_id, message_id, channel_id, movie_language in movies:
+        language_str = movie_language if movie_language else (language if language else '')
+        year_str = str(movie_year) if movie_year != 0 else ''
+        result_line = f"[{file_size}] {title} {year_str} {language_str} {quality}".strip()
+        results.append((result_line, movie_id))
+
+    # Send results as a single message with buttons
+    message_text = header + "\n".join([line for line, _ in results])
+    buttons = [
+        [InlineKeyboardButton(line, callback_data=f"download_{movie_id}")]
+        for line, movie_id in results
+    ]
+    if next_cursor:
+        buttons.append([InlineKeyboardButton("Next ▶", callback_data=f"more_{next_cursor}")])
+    return message_text, InlineKeyboardMarkup(buttons)
+
+async def show_more_results(update, context):
+    """Replace a results message with the next page of the search it shows"""
+    query = update.callback_query
+    user_id = query.from_user.id
+    after_id = query.data.split("_", 1)[1]
+
+    search = context.user_data.get('searches', {}).get(query.message.message_id)
+    if not search:
+        await query.answer(text="Search expired. Please search again.")
+        return
+
+    search_text, movie_name, year, language = search
+    try:
+        movies, next_cursor = await search_movies(movie_name, year=year, language=language, after_id=after_id)
+        if not movies:
+            await query.answer(text="No more results.")
+            return
+
+        message_text, reply_markup = build_results_page(search_text, movies, next_cursor, language)
+        await query.message.edit_text(message_text, reply_markup=reply_markup)
+        await query.answer()
+        logger.info("User %s paged search '%s' after %s", user_id, search_text, after_id)
+    except TelegramError as te:
+        logger.error("Telegram error paging search '%s' by user %s: %s", search_text, user_id, te)
+        await query.answer(text="Error occurred. Please try again later.")
+    except Exception as e:
+        logger.error("Error paging search '%s' by user %s: %s", search_text, user_id, e)
+        await query.answer(text="Error occurred. Please try again later.")
+
 async def button_callback(update, context):
-    """Handle download button clicks."""
+    """Handle download and result-paging button clicks."""
     query = update.callback_query
     data = query.data
     user_id = query.from_user.id
 
+    if data.startswith("more_"):
+        await show_more_results(update, context)
+        return
+
     if not data.startswith("download_"):
         await query.answer()
         return
@@ -562,11 +696,11 @@ async def button_callback(update, context):
     try:
         movie_id = data.split("_", 1)[1]
         # TODO: Ensure get_movie_by_id is defined in database.py or another module
-        movie = get_movie_by_id(movie_id)
+        movie = await get_movie_by_id(movie_id)
 
         if not movie:
             await query.message.reply_text("Movie not found. It may have been deleted.")
-            logger.warning(f"Movie not found for download: {movie_id} by user {user_id}")
+            logger.warning("Movie not found for download: %s by user %s", movie_id, user_id)
             await query.answer()
             return
 
@@ -576,7 +710,7 @@ async def button_callback(update, context):
             file_id=movie['file_id'],
             title=movie['title'],
             quality=movie['quality'],
-            file_size=movie['file_size'],
+            file_size=movie_file_size(movie),
             message=query.message,
             movie_id=movie_id
         )
@@ -588,11 +722,11 @@ async def button_callback(update, context):
 
     except TelegramError as te:
         await query.message.reply_text("Error sending movie. Please try again later.")
-        logger.error(f"Telegram error in download for {movie_id} by user {user_id}: {str(te)}")
+        logger.error("Telegram error in download for %s by user %s: %s", movie_id, user_id, te)
         await query.answer(text="Download error.")
     except Exception as e:
         await query.message.reply_text("An error occurred. Please try again later.")
-        logger.error(f"Error in download for {movie_id} by user {user_id}: {str(e)}")
+        logger.error("Error in download for %s by user %s: %s", movie_id, user_id, e)
         await query.answer(text="Download error.")
 
 async def set_thumbnail(update, context):
@@ -603,7 +737,7 @@ async def set_thumbnail(update, context):
             [[InlineKeyboardButton('Cancel', callback_data='cancel_thumbnail')]]
         )
     )
-    logger.info(f"User {update.message.chat_id} initiated /setthumbnail")
+    logger.info("User %s initiated /setthumbnail", update.message.chat_id)
     return SET_THUMBNAIL
 
 async def handle_thumbnail(update, context):
@@ -612,13 +746,13 @@ async def handle_thumbnail(update, context):
     
     if update.callback_query and update.callback_query.data == 'cancel_thumbnail':
         await update.callback_query.message.edit_text("Thumbnail setting cancelled.")
-        logger.info(f"User {chat_id} cancelled thumbnail setting")
+        logger.info("User %s cancelled thumbnail setting", chat_id)
         return ConversationHandler.END
         
     if update.message.text and update.message.text.lower() == 'default':
-        update_user_settings(chat_id, thumbnail_file_id=None)
+        await update_user_settings(chat_id, thumbnail_file_id=None)
         await update.message.reply_text("✅ Custom thumbnail set to default successfully!")
-        logger.info(f"User {chat_id} set thumbnail to default")
+        logger.info("User %s set thumbnail to default", chat_id)
         return ConversationHandler.END
         
     elif update.message.photo:
@@ -627,20 +761,20 @@ async def handle_thumbnail(update, context):
             file = await context.bot.get_file(thumbnail_file_id)
             if not file.file_path.lower().endswith(('.jpg', '.jpeg', '.png')):
                 await update.message.reply_text("Please upload a JPEG or PNG image.")
-                logger.warning(f"Invalid thumbnail format from user {chat_id}")
+                logger.warning("Invalid thumbnail format from user %s", chat_id)
                 return SET_THUMBNAIL
-            update_user_settings(chat_id, thumbnail_file_id=thumbnail_file_id)
+            await update_user_settings(chat_id, thumbnail_file_id=thumbnail_file_id)
             await update.message.reply_text("✅ Custom thumbnail set successfully!")
-            logger.info(f"User {chat_id} set thumbnail: {thumbnail_file_id}")
+            logger.info("User %s set thumbnail: %s", chat_id, thumbnail_file_id)
             return ConversationHandler.END
         except Exception as e:
-            logger.error(f"Error validating thumbnail for user {chat_id}: {str(e)}")
+            logger.error("Error validating thumbnail for user %s: %s", chat_id, e)
             await update.message.reply_text("Error processing thumbnail. Please try again.")
             return SET_THUMBNAIL
         
     else:
         await update.message.reply_text("Invalid input. Please upload a JPEG or PNG image or type 'default'.")
-        logger.warning(f"Invalid thumbnail input from user {chat_id}")
+        logger.warning("Invalid thumbnail input from user %s", chat_id)
         return SET_THUMBNAIL
 
 async def set_prefix(update, context):
@@ -651,7 +785,7 @@ async def set_prefix(update, context):
             [[InlineKeyboardButton('Cancel', callback_data='cancel_prefix')]]
         )
     )
-    logger.info(f"User {update.message.chat_id} initiated /setprefix")
+    logger.info("User %s initiated /setprefix", update.message.chat_id)
     return SET_PREFIX
 
 async def handle_prefix(update, context):
@@ -660,16 +794,16 @@ async def handle_prefix(update, context):
     
     if update.callback_query and update.callback_query.data == 'cancel_prefix':
         await update.callback_query.message.edit_text("Prefix setting cancelled.")
-        logger.info(f"User {chat_id} cancelled prefix setting")
+        logger.info("User %s cancelled prefix setting", chat_id)
         return ConversationHandler.END
         
     prefix = update.message.text.strip()
     if not prefix.endswith('_'):
         prefix += '_'
 
-    update_user_settings(chat_id, prefix=prefix)
+    await update_user_settings(chat_id, prefix=prefix)
     await update.message.reply_text(f"✅ Custom prefix set to: {prefix}")
-    logger.info(f"User {chat_id} set prefix: {prefix}")
+    logger.info("User %s set prefix: %s", chat_id, prefix)
     return ConversationHandler.END
 
 async def set_caption(update, context):
@@ -680,7 +814,7 @@ async def set_caption(update, context):
             [[InlineKeyboardButton('Cancel', callback_data='cancel_caption')]]
         )
     )
-    logger.info(f"User {update.message.chat_id} initiated /setcaption")
+    logger.info("User %s initiated /setcaption", update.message.chat_id)
     return SET_CAPTION
 
 async def handle_caption(update, context):
@@ -689,19 +823,19 @@ async def handle_caption(update, context):
     
     if update.callback_query and update.callback_query.data == 'cancel_caption':
         await update.callback_query.message.edit_text("Caption setting cancelled.")
-        logger.info(f"User {chat_id} cancelled caption setting")
+        logger.info("User %s cancelled caption setting", chat_id)
         return ConversationHandler.END
         
     caption = update.message.text.strip()
-    update_user_settings(chat_id, caption=caption)
+    await update_user_settings(chat_id, caption=caption)
     await update.message.reply_text(f"✅ Custom caption set to: {caption}")
-    logger.info(f"User {chat_id} set caption: {caption}")
+    logger.info("User %s set caption: %s", chat_id, caption)
     return ConversationHandler.END
 
 async def view_thumbnail(update, context):
     """Show current thumbnail setting"""
     chat_id = update.message.chat_id
-    settings = get_user_settings(chat_id)
+    settings = await get_user_settings(chat_id)
     thumbnail_file_id = settings[0]
     
     if thumbnail_file_id:
@@ -709,64 +843,58 @@ async def view_thumbnail(update, context):
             photo=thumbnail_file_id,
             caption="Your current thumbnail"
         )
-        logger.info(f"User {chat_id} viewed thumbnail")
+        logger.info("User %s viewed thumbnail", chat_id)
     else:
         await update.message.reply_text(
             "Your thumbnail is set to default (Telegram's default thumbnail will be used)."
         )
-        logger.info(f"User {chat_id} has default thumbnail")
+        logger.info("User %s has default thumbnail", chat_id)
 
 async def view_prefix(update, context):
     """Show current prefix setting"""
     chat_id = update.message.chat_id
-    settings = get_user_settings(chat_id)
+    settings = await get_user_settings(chat_id)
     prefix = settings[1]
     
     if prefix:
         await update.message.reply_text(f"Your prefix: {prefix}")
-        logger.info(f"User {chat_id} viewed prefix: {prefix}")
+        logger.info("User %s viewed prefix: %s", chat_id, prefix)
     else:
         await update.message.reply_text("No prefix set.")
-        logger.info(f"User {chat_id} has no prefix set")
+        logger.info("User %s has no prefix set", chat_id)
 
 async def view_caption(update, context):
     """Show current caption setting"""
     chat_id = update.message.chat_id
-    settings = get_user_settings(chat_id)
+    settings = await get_user_settings(chat_id)
     caption = settings[2]
     
     if caption:
         await update.message.reply_text(f"Your caption: {caption}")
-        logger.info(f"User {chat_id} viewed caption: {caption}")
+        logger.info("User %s viewed caption: %s", chat_id, caption)
     else:
         await update.message.reply_text(
             "No custom caption set. Default caption will be used."
         )
-        logger.info(f"User {chat_id} has default caption")
+        logger.info("User %s has default caption", chat_id)
 
 async def stats(update, context):
     """Show bot statistics"""
     chat_id = update.message.chat_id
     try:
-        total_users = users_collection.count_documents({})
-        total_files = movies_collection.count_documents({})
-        bot_language = "English"
-        owner_name = os.getenv("OWNER_NAME", "MovieBot Team")
-
-        stats_message = (
-            "📊 *Movie Bot Stats* 📊\n\n"
-            f"👥 *Total Users*: {total_users}\n"
-            f"🎥 *Total Movies*: {total_files}\n"
-            f"🌐 *Bot Language*: {bot_language}\n"
-            f"👤 *Owner*: {owner_name}\n\n"
-            "Thank you for using Movie Bot! 🎉"
+        total_users, total_files = await get_collection_counts()
+        stats_message = STATS_TEMPLATE.format(
+            total_users=total_users,
+            total_files=total_files,
+            bot_language="English",
+            owner_name=OWNER_NAME
         )
 
         await update.message.reply_text(stats_message, parse_mode='Markdown')
-        logger.info(f"User {chat_id} viewed bot stats: {total_users} users, {total_files} movies")
+        logger.info("User %s viewed bot stats: %s users, %s movies", chat_id, total_users, total_files)
     except Exception as e:
         await update.message.reply_text("Error retrieving stats. Please try again later.")
-        logger.error(f"Error retrieving stats for user {chat_id}: {str(e)}")
+        logger.error("Error retrieving stats for user %s: %s", chat_id, e)
 
 async def cancel(update, context):
     """Cancel any ongoing conversation or indexing"""
@@ -775,5 +903,5 @@ async def cancel(update, context):
     context.user_data['index_channel_id'] = None
     context.user_data['index_mode'] = None
     await update.message.reply_text('Operation cancelled.')
-    logger.info(f"User {chat_id} cancelled operation")
+    logger.info("User %s cancelled operation", chat_id)
     return ConversationHandler.END
@@ -1,29 +1,16 @@
 import logging
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultDocument
 from telegram.error import TelegramError
-from database import search_movies, get_user_settings
-from pymongo import MongoClient
-from dotenv import load_dotenv
-import os
-
-# Load environment variables
-load_dotenv()
-
-# MongoDB connection
-MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
-db = client["movie_bot"]
-movies_collection = db["movies"]
-
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from database import search_movies, get_user_settings, get_movie_by_id
+from handlers import LANGUAGES
+
 logger = logging.getLogger(__name__)
 
 async def inline_query(update, context):
     query = update.inline_query.query.strip()
     user_id = update.inline_query.from_user.id
 
-    logger.info(f"User {user_id} sent inline query: '{query}'")
+    logger.info("User %s sent inline query: '%s'", user_id, query)
 
     if not query:
         await update.inline_query.answer(
@@ -31,7 +18,7 @@ async def inline_query(update, context):
             switch_pm_text="Type a movie name to search",
             switch_pm_parameter="empty_query"
         )
-        logger.info(f"User {user_id} sent empty inline query")
+        logger.info("User %s sent empty inline query", user_id)
         return
 
     try:
@@ -49,14 +36,13 @@ async def inline_query(update, context):
             pass
 
         # Check for language keywords
-        language_terms = ['tamil', 'english', 'hindi']
         for term in search_terms[:]:
-            if term.lower() in language_terms:
+            if term.lower() in LANGUAGES:
                 language = term.lower()
                 search_terms.remove(term)
 
         movie_name = " ".join(search_terms)
-        movies = search_movies(movie_name, year=year, language=language)
+        movies, _ = await search_movies(movie_name, year=year, language=language)
 
         if not movies:
             await update.inline_query.answer(
@@ -64,12 +50,12 @@ async def inline_query(update, context):
                 switch_pm_text="No movies found. Try another search.",
                 switch_pm_parameter="no_results"
             )
-            logger.info(f"No movies found for query: '{query}' by user {user_id}")
+            logger.info("No movies found for query: '%s' by user %s", query, user_id)
             return
 
         results = []
-        for title, movie_year, quality, file_size, file_id, message_id in movies:
-            result_id = f"{file_id}_{message_id}_{movie_year}"
+        for movie_id, title, movie_year, quality, file_size, file_id, message_id, channel_id, movie_language in movies:
+            result_id = movie_id
             results.append(
                 InlineQueryResultDocument(
                     id=result_id,
@@ -83,7 +69,7 @@ async def inline_query(update, context):
                 )
             )
 
-        logger.info(f"Found {len(results)} movies for query: '{query}' by user {user_id}")
+        logger.info("Found %s movies for query: '%s' by user %s", len(results), query, user_id)
         await update.inline_query.answer(
             results,
             cache_time=300,
@@ -92,14 +78,14 @@ async def inline_query(update, context):
         )
 
     except TelegramError as te:
-        logger.error(f"Telegram error in inline query '{query}' by user {user_id}: {str(te)}")
+        logger.error("Telegram error in inline query '%s' by user %s: %s", query, user_id, te)
         await update.inline_query.answer(
             [],
             switch_pm_text="Error occurred. Try again later.",
             switch_pm_parameter="error"
         )
     except Exception as e:
-        logger.error(f"Error in inline query '{query}' by user {user_id}: {str(e)}")
+        logger.error("Error in inline query '%s' by user %s: %s", query, user_id, e)
         await update.inline_query.answer(
             [],
             switch_pm_text="Error occurred. Try again later.",
@@ -117,16 +103,15 @@ async def button_callback(update, context):
 
     try:
         result_id = data.split("_", 1)[1]
-        file_id, message_id, movie_year = result_id.split("_")
-        movie = movies_collection.find_one({"file_id": file_id, "message_id": int(message_id)})
+        movie = await get_movie_by_id(result_id)
 
         if not movie:
             await query.message.reply_text("Movie not found. It may have been deleted.")
-            logger.warning(f"Movie not found for download: {result_id} by user {user_id}")
+            logger.warning("Movie not found for download: %s by user %s", result_id, user_id)
             await query.answer()
             return
 
-        thumbnail_file_id, prefix, caption = get_user_settings(user_id)
+        thumbnail_file_id, prefix, caption = await get_user_settings(user_id)
         final_caption = caption or f"{movie['title']} ({movie['year']}, {movie['quality']})"
 
         await query.message.reply_document(
@@ -135,15 +120,15 @@ async def button_callback(update, context):
             thumb=thumbnail_file_id,
             parse_mode='Markdown'
         )
-        logger.info(f"User {user_id} downloaded movie: {movie['title']} ({movie['_id']})")
+        logger.info("User %s downloaded movie: %s (%s)", user_id, movie['title'], movie['_id'])
 
         await query.answer(text="Download started!")
 
     except TelegramError as te:
-        logger.error(f"Telegram error in download for {result_id} by user {user_id}: {str(te)}")
+        logger.error("Telegram error in download for %s by user %s: %s", result_id, user_id, te)
         await query.message.reply_text("Error sending movie. Please try again later.")
         await query.answer(text="Download error.")
     except Exception as e:
-        logger.error(f"Error in download for {result_id} by user {user_id}: {str(e)}")
+        logger.error("Error in download for %s by user %s: %s", result_id, user_id, e)
         await query.message.reply_text("An error occurred. Please try again later.")
         await query.answer(text="Download error.")
@@ -1,4 +1,3 @@
-import os
 import signal
 import logging
 import asyncio
@@ -16,6 +15,7 @@ from handlers import (
     start,
     index,
     handle_forwarded_message,
+    cancel_indexing,
     search_movie,
     button_callback,
     set_thumbnail,
@@ -33,32 +33,25 @@ from handlers import (
     SET_PREFIX,
     SET_CAPTION,
 )
-from database import check_db_connection
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from config import TELEGRAM_BOT_TOKEN, WEBHOOK_URL, WEBHOOK_PORT, WEBHOOK_SECRET
+from database import check_db_connection, init_db
+from utils import telethon_client
 
 # Bot version
 BOT_VERSION = "1.0.0"
 
-# Set up logging
-logging.basicConfig(
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
 logger = logging.getLogger(__name__)
 
 async def error_handler(update: Update, context):
     """Handle errors and log them."""
     try:
-        logger.error(f"Update {update} caused error: {context.error}", exc_info=context.error)
+        logger.error("Update %s caused error: %s", update, context.error, exc_info=context.error)
         if update and update.message:
             await update.message.reply_text("An error occurred. Please try again later.")
     except TelegramError as te:
-        logger.error(f"Error sending error message: {str(te)}")
+        logger.error("Error sending error message: %s", te)
     except Exception as e:
-        logger.error(f"Unexpected error in error_handler: {str(e)}")
+        logger.error("Unexpected error in error_handler: %s", e)
 
 async def cleanup_recent_searches(context):
     """Periodically clean up recent_searches to prevent memory growth."""
@@ -72,28 +65,29 @@ async def cleanup_recent_searches(context):
             ]
             for chat_id in expired:
                 del context.bot_data["recent_searches"][chat_id]
-            logger.info(f"Cleaned up {len(expired)} expired search records")
+            logger.info("Cleaned up %s expired search records", len(expired))
         except Exception as e:
-            logger.error(f"Error in cleanup_recent_searches: {str(e)}")
+            logger.error("Error in cleanup_recent_searches: %s", e)
         await asyncio.sleep(3600)  # Run hourly
 
 async def main():
     """Main function to set up and run the bot."""
-    bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+    bot_token = TELEGRAM_BOT_TOKEN
     if not bot_token:
         logger.error("TELEGRAM_BOT_TOKEN is not set")
         raise ValueError("TELEGRAM_BOT_TOKEN is not set")
 
-    logger.info(f"Starting Telegram bot (version {BOT_VERSION}) with token: {bot_token[:10]}...")
+    logger.info("Starting Telegram bot (version %s)", BOT_VERSION)
 
     # Check MongoDB connection
     try:
-        if not check_db_connection():
+        if not await check_db_connection():
             logger.error("MongoDB connection failed")
             raise ConnectionError("MongoDB connection failed")
         logger.info("MongoDB connection is healthy")
+        await init_db()
     except Exception as e:
-        logger.error(f"Database connection error: {str(e)}")
+        logger.error("Database connection error: %s", e)
         raise
 
     # Build the application
@@ -145,27 +139,50 @@ async def main():
 
     # Message handlers
     application.add_handler(MessageHandler(filters.Regex(r"^(batch|single)$"), handle_forwarded_message))
-    application.add_handler(MessageHandler(filters.FORWARDED, handle_forwarded_message))
+    # Non-blocking so the Cancel button is handled while a channel is being indexed
+    application.add_handler(MessageHandler(filters.FORWARDED, handle_forwarded_message, block=False))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE, search_movie))
 
-    # Callback query handler
+    # Callback query handlers
+    application.add_handler(CallbackQueryHandler(cancel_indexing, pattern=r"^index_cancel$"))
     application.add_handler(CallbackQueryHandler(button_callback))
 
     # Initialize and start polling
     try:
         await application.initialize()
         await application.start()
-        logger.info("Bot started polling")
+        logger.info("Bot started")
 
         # Start cleanup task
         cleanup_task = asyncio.create_task(cleanup_recent_searches(application))
 
-        # Start polling with timeout configuration
-        await application.updater.start_polling(
-            timeout=20.0,
-            drop_pending_updates=True,
-            allowed_updates=Update.ALL_TYPES,
-        )
+        # Connect the shared Telethon client once; indexing and large downloads reuse it
+        if telethon_client:
+            try:
+                await telethon_client.start()
+                logger.info("Telethon client connected")
+            except Exception as e:
+                logger.error("Failed to connect Telethon client: %s", e)
+
+        if WEBHOOK_URL:
+            # Telegram pushes updates to us instead of being long-polled
+            await application.updater.start_webhook(
+                listen="0.0.0.0",
+                port=WEBHOOK_PORT,
+                url_path="telegram",
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/telegram",
+                secret_token=WEBHOOK_SECRET,
+                drop_pending_updates=True,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info("Receiving updates via webhook on port %s", WEBHOOK_PORT)
+        else:
+            # Start polling with timeout configuration
+            await application.updater.start_polling(
+                timeout=20.0,
+                drop_pending_updates=True,
+                allowed_updates=Update.ALL_TYPES,
+            )
 
         # Keep the bot running until a shutdown signal is received
         shutdown_event = asyncio.Event()
@@ -176,7 +193,7 @@ async def main():
         await shutdown_event.wait()
 
     except Exception as e:
-        logger.error(f"Fatal error in main: {str(e)}", exc_info=True)
+        logger.error("Fatal error in main: %s", e, exc_info=True)
         raise
     finally:
         try:
@@ -187,20 +204,23 @@ async def main():
             except asyncio.CancelledError:
                 logger.info("Cleanup task cancelled")
 
+            if telethon_client and telethon_client.is_connected():
+                await telethon_client.disconnect()
+
             # Stop and shut down the application
             await application.updater.stop()
             await application.stop()
             await application.shutdown()
             logger.info("Bot shut down successfully")
         except Exception as e:
-            logger.error(f"Error during shutdown: {str(e)}")
+            logger.error("Error during shutdown: %s", e)
 
 def handle_shutdown(loop, application):
     """Handle shutdown signals gracefully."""
     logger.info("Received shutdown signal, stopping bot...")
     tasks = [task for task in asyncio.all_tasks(loop) if task is not asyncio.current_task()]
     for task in tasks:
-        logger.info(f"Cancelling task: {task}")
+        logger.info("Cancelling task: %s", task)
         task.cancel()
     loop.run_until_complete(application.updater.stop())
     loop.run_until_complete(application.stop())
@@ -222,7 +242,7 @@ if __name__ == "__main__":
     try:
         loop.run_until_complete(main())
     except Exception as e:
-        logger.error(f"Startup error: {str(e)}")
+        logger.error("Startup error: %s", e)
         raise
     finally:
         if not loop.is_closed():